@@ -35,6 +35,7 @@ from iib.workers.tasks.build import (
 )
 from iib.workers.tasks.build_regenerate_bundle import handle_regenerate_bundle_request
 from iib.workers.tasks.build_merge_index_image import handle_merge_request
+from iib.workers.tasks.celery import app as celery_app
 from iib.workers.tasks.general import failed_request_callback
 
 api_v1 = flask.Blueprint('api_v1', __name__)
@@ -572,24 +573,28 @@ def regenerate_bundle_batch():
     # through the list of requests another time
     processed_request_ids = []
     build_and_requests = zip(payload['build_requests'], requests)
-    try:
-        for build_request, request in build_and_requests:
-            error_callback = failed_request_callback.s(request.id)
-            handle_regenerate_bundle_request.apply_async(
-                args=[
-                    build_request['from_bundle_image'],
-                    build_request.get('organization'),
-                    request.id,
-                ],
-                link_error=error_callback,
-                queue=_get_user_queue(),
-            )
+    # Publish all the tasks of the batch with the same producer instead of acquiring one from the
+    # pool for every task
+    with celery_app.producer_or_acquire() as producer:
+        try:
+            for build_request, request in build_and_requests:
+                error_callback = failed_request_callback.s(request.id)
+                handle_regenerate_bundle_request.apply_async(
+                    args=[
+                        build_request['from_bundle_image'],
+                        build_request.get('organization'),
+                        request.id,
+                    ],
+                    link_error=error_callback,
+                    queue=_get_user_queue(),
+                    producer=producer,
+                )
 
-            request_jsons.append(request.to_json())
-            processed_request_ids.append(str(request.id))
-    except kombu.exceptions.OperationalError:
-        unprocessed_requests = [r for r in requests if str(r.id) not in processed_request_ids]
-        handle_broker_batch_error(unprocessed_requests)
+                request_jsons.append(request.to_json())
+                processed_request_ids.append(str(request.id))
+        except kombu.exceptions.OperationalError:
+            unprocessed_requests = [r for r in requests if str(r.id) not in processed_request_ids]
+            handle_broker_batch_error(unprocessed_requests)
 
     flask.current_app.logger.debug(
         'Successfully scheduled the batch %d with requests: %s',
@@ -646,41 +651,48 @@ def add_rm_batch():
     # This list will be used for the log message below and avoids the need of having to iterate
     # through the list of requests another time
     processed_request_ids = []
-    for build_request, request in zip(payload['build_requests'], requests):
-        request_jsons.append(request.to_json())
+    # Publish all the tasks of the batch with the same producer instead of acquiring one from the
+    # pool for every task
+    with celery_app.producer_or_acquire() as producer:
+        for build_request, request in zip(payload['build_requests'], requests):
+            request_jsons.append(request.to_json())
 
-        overwrite_from_index = _should_force_overwrite() or build_request.get(
-            'overwrite_from_index'
-        )
-        celery_queue = _get_user_queue(serial=overwrite_from_index)
-        if isinstance(request, RequestAdd):
-            args = _get_add_args(build_request, request, overwrite_from_index, celery_queue)
-        elif isinstance(request, RequestRm):
-            args = _get_rm_args(build_request, request, overwrite_from_index)
+            overwrite_from_index = _should_force_overwrite() or build_request.get(
+                'overwrite_from_index'
+            )
+            celery_queue = _get_user_queue(serial=overwrite_from_index)
+            if isinstance(request, RequestAdd):
+                args = _get_add_args(build_request, request, overwrite_from_index, celery_queue)
+            elif isinstance(request, RequestRm):
+                args = _get_rm_args(build_request, request, overwrite_from_index)
 
-        safe_args = _get_safe_args(args, build_request)
+            safe_args = _get_safe_args(args, build_request)
 
-        error_callback = failed_request_callback.s(request.id)
-        try:
-            if isinstance(request, RequestAdd):
-                handle_add_request.apply_async(
-                    args=args,
-                    link_error=error_callback,
-                    argsrepr=repr(safe_args),
-                    queue=celery_queue,
-                )
-            else:
-                handle_rm_request.apply_async(
-                    args=args,
-                    link_error=error_callback,
-                    argsrepr=repr(safe_args),
-                    queue=celery_queue,
-                )
-        except kombu.exceptions.OperationalError:
-            unprocessed_requests = [r for r in requests if str(r.id) not in processed_request_ids]
-            handle_broker_batch_error(unprocessed_requests)
+            error_callback = failed_request_callback.s(request.id)
+            try:
+                if isinstance(request, RequestAdd):
+                    handle_add_request.apply_async(
+                        args=args,
+                        link_error=error_callback,
+                        argsrepr=repr(safe_args),
+                        queue=celery_queue,
+                        producer=producer,
+                    )
+                else:
+                    handle_rm_request.apply_async(
+                        args=args,
+                        link_error=error_callback,
+                        argsrepr=repr(safe_args),
+                        queue=celery_queue,
+                        producer=producer,
+                    )
+            except kombu.exceptions.OperationalError:
+                unprocessed_requests = [
+                    r for r in requests if str(r.id) not in processed_request_ids
+                ]
+                handle_broker_batch_error(unprocessed_requests)
 
-        processed_request_ids.append(str(request.id))
+            processed_request_ids.append(str(request.id))
 
     flask.current_app.logger.debug(
         'Successfully scheduled the batch %d with requests: %s',
@@ -12,6 +12,10 @@ class Config(object):
     # When publishing a message, don't continuously retry or else the HTTP connection times out
     broker_transport_options = {'max_retries': 10}
     iib_api_timeout = 30
+    iib_build_tmpdir = None
+    iib_cleanup_free_threshold = None
+    iib_cleanup_image_age = '24h'
+    iib_container_storage_path = '/var/lib/containers'
     iib_docker_config_template = os.path.join(
         os.path.expanduser('~'), '.docker', 'config.json.template'
     )
@@ -20,9 +24,11 @@ class Config(object):
     iib_grpc_max_port_tries = 100
     iib_grpc_max_tries = 5
     iib_grpc_start_port = 50051
+    iib_image_inspection_threads = 5
     iib_image_push_template = '{registry}/iib-build:{request_id}'
     iib_index_image_output_registry = None
     iib_log_level = 'INFO'
+    iib_manifest_list_tool = 'manifest-tool'
     iib_organization_customizations = {}
     iib_request_logs_dir = None
     iib_request_logs_format = (
@@ -52,7 +58,11 @@ class Config(object):
     task_default_routing_key = 'iib'
     # Requeue the message if the worker abruptly exits or is signaled
     task_reject_on_worker_lost = True
-    # For now, only allow a single process so that all tasks are processed serially
+    # For now, only allow a single process so that all tasks are processed serially. Tasks must not
+    # run concurrently on the same host, whether with a higher concurrency or with the threads or
+    # gevent pools, since they reset the shared Docker config.json and remove all the container
+    # images. Instead, the I/O bound work within a task, such as building the arch images and
+    # inspecting the bundle images, is parallelized with threads.
     worker_concurrency = 1
     # Don't allow the worker to fetch more messages than it can handle at a time. This is so that
     # other tasks aren't starved. This will only be useful once more workers are enabled.
@@ -156,6 +166,37 @@ def validate_celery_config(conf, **kwargs):
     if not isinstance(conf['iib_required_labels'], dict):
         raise ConfigError('iib_required_labels must be a dictionary')
 
+    if conf.get('iib_manifest_list_tool', 'manifest-tool') not in ('buildah', 'manifest-tool'):
+        raise ConfigError('iib_manifest_list_tool must be one of "buildah" or "manifest-tool"')
+
+    iib_cleanup_free_threshold = conf.get('iib_cleanup_free_threshold')
+    if iib_cleanup_free_threshold is not None and (
+        not isinstance(iib_cleanup_free_threshold, (int, float))
+        or not 0 <= iib_cleanup_free_threshold <= 1
+    ):
+        raise ConfigError('iib_cleanup_free_threshold must be a number between 0 and 1')
+
+    iib_build_tmpdir = conf.get('iib_build_tmpdir')
+    if iib_build_tmpdir and not os.path.isdir(iib_build_tmpdir):
+        raise ConfigError(f'iib_build_tmpdir, {iib_build_tmpdir}, must exist and be a directory')
+
+    iib_container_storage_path = conf.get('iib_container_storage_path')
+    if iib_cleanup_free_threshold is not None and not os.path.isdir(
+        iib_container_storage_path or ''
+    ):
+        raise ConfigError(
+            f'iib_container_storage_path, {iib_container_storage_path}, must exist and be a '
+            'directory when iib_cleanup_free_threshold is set'
+        )
+
+    iib_image_inspection_threads = conf.get('iib_image_inspection_threads', 5)
+    if (
+        not isinstance(iib_image_inspection_threads, int)
+        or isinstance(iib_image_inspection_threads, bool)
+        or iib_image_inspection_threads < 1
+    ):
+        raise ConfigError('iib_image_inspection_threads must be a positive integer')
+
     _validate_iib_org_customizations(conf['iib_organization_customizations'])
 
     iib_request_logs_dir = conf.get('iib_request_logs_dir')
@@ -1,15 +1,19 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
+import concurrent.futures
+import hashlib
+import io
 import json
 import logging
 import os
 import re
+import shutil
 import stat
 import subprocess
 import time
 import tempfile
-import textwrap
 
 from operator_manifest.operator import ImageName
+import ruamel.yaml
 
 from iib.exceptions import IIBError, AddressAlreadyInUse
 from iib.workers.api_utils import set_request_state, update_request
@@ -33,7 +37,6 @@ from iib.workers.tasks.utils import (
     retry,
     run_cmd,
     set_registry_token,
-    skopeo_inspect,
     RequestConfigAddRm,
     get_image_label,
     verify_labels,
@@ -45,6 +48,9 @@ __all__ = ['handle_add_request', 'handle_rm_request']
 
 
 log = logging.getLogger(__name__)
+yaml = ruamel.yaml.YAML()
+# The label on the index image holding the key of the inputs it was built from
+_BUILD_INPUTS_LABEL = 'com.redhat.iib.build-inputs'
 
 
 def _build_image(dockerfile_dir, dockerfile_name, request_id, arch):
@@ -67,40 +73,182 @@ def _build_image(dockerfile_dir, dockerfile_name, request_id, arch):
         destination,
     )
     dockerfile_path = os.path.join(dockerfile_dir, dockerfile_name)
-    run_cmd(
-        [
-            'buildah',
-            'bud',
-            '--no-cache',
-            '--override-arch',
-            arch,
-            '-t',
-            destination,
-            '-f',
-            dockerfile_path,
-        ],
-        {'cwd': dockerfile_dir},
-        exc_msg=f'Failed to build the container image on the arch {arch}',
-    )
+    params = {'cwd': dockerfile_dir}
+    build_tmpdir = None
+    conf = get_worker_config()
+    try:
+        if conf.iib_build_tmpdir:
+            # buildah stages the layer blobs in TMPDIR while committing the image. Pointing it to
+            # a RAM-backed file system such as /dev/shm avoids writing every layer to disk twice.
+            build_tmpdir = tempfile.TemporaryDirectory(
+                prefix=f'iib-{request_id}-{arch}-', dir=conf.iib_build_tmpdir
+            )
+            log.debug('Using %s as the temporary directory for buildah', build_tmpdir.name)
+            params['env'] = {**os.environ, 'TMPDIR': build_tmpdir.name}
+
+        run_cmd(
+            [
+                'buildah',
+                'bud',
+                '--no-cache',
+                '--override-arch',
+                arch,
+                '-t',
+                destination,
+                '-f',
+                dockerfile_path,
+            ],
+            params,
+            exc_msg=f'Failed to build the container image on the arch {arch}',
+            capture_stdout=False,
+        )
+    finally:
+        if build_tmpdir:
+            build_tmpdir.cleanup()
+
+
+def _build_and_push_images(dockerfile_dir, dockerfile_name, request_id, arches):
+    """
+    Build and push the container image for each of the architectures in parallel.
+
+    Building and pushing the image is mostly spent waiting on buildah and the container registry,
+    so every architecture is handled in its own thread. This function only returns once all the
+    architectures are pushed, so the manifest list can be created right after it.
+
+    :param str dockerfile_dir: the path to the directory containing the data used for
+        building the container image
+    :param str dockerfile_name: the name of the Dockerfile in the dockerfile_dir to
+        be used when building the container image
+    :param int request_id: the ID of the IIB build request
+    :param iter arches: an iterable of arches to build and push the container image for
+    :raises IIBError: if the build or the push fails for any of the architectures
+    """
+
+    def _build_and_push_image(arch):
+        _build_image(dockerfile_dir, dockerfile_name, request_id, arch)
+        _push_image(request_id, arch)
+
+    sorted_arches = sorted(arches)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(sorted_arches)) as executor:
+        futures = [executor.submit(_build_and_push_image, arch) for arch in sorted_arches]
+
+    # Raise the first failure, if any, after all the architectures have finished
+    for future in futures:
+        future.result()
+
+
+def _get_build_inputs_key(**build_inputs):
+    """
+    Get a key that identifies the inputs of an index image build.
+
+    :param build_inputs: the JSON serializable inputs that determine the content of the index
+        image. Lists are sorted so that the order of the inputs doesn't change the key.
+    :return: the hex digest of the SHA-256 hash of the inputs
+    :rtype: str
+    """
+    normalized_inputs = {
+        key: sorted(value) if isinstance(value, (list, set)) else value
+        for key, value in build_inputs.items()
+    }
+    return hashlib.sha256(json.dumps(normalized_inputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _are_arch_images_built(request_id, arches, build_inputs_key):
+    """
+    Determine if the arch images of the request were already pushed from the same build inputs.
+
+    :param int request_id: the ID of the IIB build request
+    :param iter arches: an iterable of arches the index image is built for
+    :param str build_inputs_key: the key of the build inputs as returned by
+        ``_get_build_inputs_key``
+    :return: ``True`` if every arch image exists and was built from the same inputs
+    :rtype: bool
+    """
+    skopeo_timeout = get_worker_config().iib_skopeo_timeout
+    for arch in sorted(arches):
+        arch_pull_spec = _get_external_arch_pull_spec(request_id, arch, include_transport=True)
+        # Call skopeo directly instead of skopeo_inspect since the image not existing is expected
+        # and it shouldn't be retried or logged as an error
+        try:
+            image_config = json.loads(
+                run_cmd(
+                    [
+                        'skopeo',
+                        '--command-timeout',
+                        skopeo_timeout,
+                        'inspect',
+                        '--config',
+                        arch_pull_spec,
+                    ],
+                    exc_msg=f'Failed to inspect {arch_pull_spec}',
+                    log_failure=False,
+                )
+            )
+        except IIBError:
+            return False
+
+        labels = image_config.get('config', {}).get('Labels') or {}
+        if labels.get(_BUILD_INPUTS_LABEL) != build_inputs_key:
+            return False
+
+    return True
 
 
 def _cleanup():
     """
-    Remove all existing container images on the host.
+    Remove the existing container images on the host.
 
-    This will ensure that the host will not run out of disk space due to stale data, and that
-    all images referenced using floating tags will be up to date on the host.
+    By default, all the container images are removed. This will ensure that the host will not run
+    out of disk space due to stale data, and that all images referenced using floating tags will be
+    up to date on the host.
+
+    If ``iib_cleanup_free_threshold`` is set, the container images are only pruned when the free
+    space in ``iib_container_storage_path`` drops to that fraction or below. This keeps the images
+    pulled by previous requests, such as the binary image, available for the next build on this
+    host until then. Only the images created more than ``iib_cleanup_image_age`` ago are pruned.
+    Note that this is based on the creation time of the image, not on when it was pulled.
 
     Additionally, this function will reset the Docker ``config.json`` to
     ``iib_docker_config_template``.
 
     :raises IIBError: if the command to remove the container images fails
     """
-    log.info('Removing all existing container images')
-    run_cmd(
-        ['podman', 'rmi', '--all', '--force'],
-        exc_msg='Failed to remove the existing container images',
-    )
+    conf = get_worker_config()
+    free_threshold = conf['iib_cleanup_free_threshold']
+    if free_threshold is None:
+        log.info('Removing all existing container images')
+        run_cmd(
+            ['podman', 'rmi', '--all', '--force'],
+            exc_msg='Failed to remove the existing container images',
+            capture_stdout=False,
+        )
+    else:
+        disk_usage = shutil.disk_usage(conf['iib_container_storage_path'])
+        free_fraction = disk_usage.free / disk_usage.total
+        if free_fraction > free_threshold:
+            log.info(
+                'Skipping the removal of the existing container images since %.0f%% of %s is free',
+                free_fraction * 100,
+                conf['iib_container_storage_path'],
+            )
+        else:
+            log.info(
+                'Removing the existing container images older than %s',
+                conf['iib_cleanup_image_age'],
+            )
+            run_cmd(
+                [
+                    'podman',
+                    'image',
+                    'prune',
+                    '--all',
+                    '--force',
+                    '--filter',
+                    f'until={conf["iib_cleanup_image_age"]}',
+                ],
+                exc_msg='Failed to remove the existing container images',
+                capture_stdout=False,
+            )
     reset_docker_config()
 
 
@@ -117,49 +265,119 @@ def _create_and_push_manifest_list(request_id, arches):
     """
     output_pull_spec = get_rebuilt_image_pull_spec(request_id)
     log.info('Creating the manifest list %s', output_pull_spec)
+    if get_worker_config()['iib_manifest_list_tool'] == 'buildah':
+        _create_and_push_manifest_list_with_buildah(output_pull_spec, request_id, arches)
+        return output_pull_spec
+
     with tempfile.TemporaryDirectory(prefix='iib-') as temp_dir:
         manifest_yaml = os.path.abspath(os.path.join(temp_dir, 'manifest.yaml'))
-        with open(manifest_yaml, 'w+') as manifest_yaml_f:
-            manifest_yaml_f.write(
-                textwrap.dedent(
-                    f'''\
-                    image: {output_pull_spec}
-                    manifests:
-                    '''
-                )
-            )
-            for arch in sorted(arches):
-                arch_pull_spec = _get_external_arch_pull_spec(request_id, arch)
-                log.debug(
-                    'Adding the manifest %s to the manifest list %s',
-                    arch_pull_spec,
-                    output_pull_spec,
-                )
-                manifest_yaml_f.write(
-                    textwrap.dedent(
-                        f'''\
-                        - image: {arch_pull_spec}
-                          platform:
-                            architecture: {arch}
-                            os: linux
-                        '''
-                    )
-                )
-            # Return back to the beginning of the file to output it to the logs
-            manifest_yaml_f.seek(0)
+        manifests = []
+        for arch in sorted(arches):
+            arch_pull_spec = _get_external_arch_pull_spec(request_id, arch)
             log.debug(
-                'Created the manifest configuration with the following content:\n%s',
-                manifest_yaml_f.read(),
+                'Adding the manifest %s to the manifest list %s', arch_pull_spec, output_pull_spec
+            )
+            manifests.append(
+                {'image': arch_pull_spec, 'platform': {'architecture': arch, 'os': 'linux'}}
             )
+        manifest_stream = io.StringIO()
+        yaml.dump({'image': output_pull_spec, 'manifests': manifests}, manifest_stream)
+        manifest_content = manifest_stream.getvalue()
+        with open(manifest_yaml, 'w') as manifest_yaml_f:
+            manifest_yaml_f.write(manifest_content)
+        log.debug(
+            'Created the manifest configuration with the following content:\n%s', manifest_content
+        )
 
         run_cmd(
             ['manifest-tool', 'push', 'from-spec', manifest_yaml],
             exc_msg=f'Failed to push the manifest list to {output_pull_spec}',
+            capture_stdout=False,
         )
 
     return output_pull_spec
 
 
+def _create_and_push_manifest_list_with_buildah(output_pull_spec, request_id, arches):
+    """
+    Create the manifest list in the local container storage and push it with buildah.
+
+    The local manifest list is always removed afterwards so that a retry can recreate it. A
+    manifest list left behind by a previous attempt that was interrupted, such as when the worker
+    was killed, is removed beforehand.
+
+    :param str output_pull_spec: the pull specification to push the manifest list to
+    :param int request_id: the ID of the IIB build request
+    :param iter arches: an iterable of arches to create the manifest list for
+    :raises IIBError: if creating or pushing the manifest list fails
+    """
+    manifest_list = f'iib-build-manifest-list:{request_id}'
+    try:
+        # The manifest list normally doesn't exist, so don't log the failure as an error
+        run_cmd(
+            ['buildah', 'rmi', manifest_list],
+            exc_msg=f'Failed to remove the manifest list {manifest_list}',
+            capture_stdout=False,
+            log_failure=False,
+        )
+    except IIBError:
+        pass
+    else:
+        log.info('Removed the leftover manifest list %s', manifest_list)
+
+    run_cmd(
+        ['buildah', 'manifest', 'create', manifest_list],
+        exc_msg=f'Failed to create the manifest list {manifest_list}',
+        capture_stdout=False,
+    )
+    try:
+        for arch in sorted(arches):
+            arch_pull_spec = _get_external_arch_pull_spec(request_id, arch)
+            log.debug(
+                'Adding the manifest %s to the manifest list %s', arch_pull_spec, output_pull_spec
+            )
+            run_cmd(
+                [
+                    'buildah',
+                    'manifest',
+                    'add',
+                    '--arch',
+                    arch,
+                    '--os',
+                    'linux',
+                    manifest_list,
+                    f'docker://{arch_pull_spec}',
+                ],
+                exc_msg=f'Failed to add {arch_pull_spec} to the manifest list',
+                capture_stdout=False,
+            )
+
+        # The arch images were already pushed to the same repository, so only the manifest list
+        # itself needs to be pushed
+        run_cmd(
+            [
+                'buildah',
+                'manifest',
+                'push',
+                '--format',
+                'v2s2',
+                manifest_list,
+                f'docker://{output_pull_spec}',
+            ],
+            exc_msg=f'Failed to push the manifest list to {output_pull_spec}',
+            capture_stdout=False,
+        )
+    finally:
+        try:
+            run_cmd(
+                ['buildah', 'rmi', manifest_list],
+                exc_msg=f'Failed to remove the manifest list {manifest_list}',
+                capture_stdout=False,
+            )
+        except IIBError:
+            log.warning('Failed to remove the local manifest list %s', manifest_list)
+
+
 def _update_index_image_pull_spec(
     output_pull_spec,
     request_id,
@@ -344,8 +562,11 @@ def _serve_index_registry_at_port(db_path, port, max_tries, wait_time):
             universal_newlines=True,
         )
         start_time = time.time()
+        # Poll often at first since the service usually starts quickly, and then back off
+        poll_interval = 0.1
         while time.time() - start_time < wait_time:
-            time.sleep(1)
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, 1)
             ret = rpc_proc.poll()
             # process has terminated
             if ret is not None:
@@ -354,10 +575,12 @@ def _serve_index_registry_at_port(db_path, port, max_tries, wait_time):
                     raise AddressAlreadyInUse(f'Port {port} is already used by a different service')
                 raise IIBError(f'Command "{" ".join(cmd)}" has failed with error "{stderr}"')
 
-            # query the service to see if it has started
+            # query the service to see if it has started. It's expected to fail until the service
+            # is ready, so don't log the failure as an error.
             try:
                 output = run_cmd(
-                    ['grpcurl', '-plaintext', f'localhost:{port}', 'list', 'api.Registry']
+                    ['grpcurl', '-plaintext', f'localhost:{port}', 'list', 'api.Registry'],
+                    log_failure=False,
                 )
             except IIBError:
                 output = ''
@@ -399,12 +622,14 @@ def _get_present_bundles(from_index, base_dir):
     # Transform returned data to parsable json
     unique_present_bundles = []
     unique_present_bundles_pull_spec = []
+    seen_bundle_paths = set()
     present_bundles = [json.loads(bundle) for bundle in re.split(r'(?<=})\n(?={)', bundles)]
 
     for bundle in present_bundles:
         bundle_path = bundle['bundlePath']
-        if bundle_path in unique_present_bundles_pull_spec:
+        if bundle_path in seen_bundle_paths:
             continue
+        seen_bundle_paths.add(bundle_path)
         unique_present_bundles.append(bundle)
         unique_present_bundles_pull_spec.append(bundle_path)
 
@@ -420,11 +645,11 @@ def _get_missing_bundles(present_bundles, bundles):
     :return: list of bundles not present in the index image.
     :rtype: list
     """
-    present_bundle_hashes = []
+    present_bundle_hashes = set()
     filtered_bundles = []
     for bundle in present_bundles:
         if '@sha256:' in bundle['bundlePath']:
-            present_bundle_hashes.append(bundle['bundlePath'].split('@sha256:')[-1])
+            present_bundle_hashes.add(bundle['bundlePath'].split('@sha256:')[-1])
 
     for bundle in bundles:
         if bundle.split('@sha256:')[-1] not in present_bundle_hashes:
@@ -483,7 +708,11 @@ def _opm_index_add(
         cmd.append('--container-tool')
         cmd.append(container_tool)
 
-    log.info('Generating the database file with the following bundle(s): %s', ', '.join(bundles))
+    log.info(
+        'Generating the database file with the following %d bundle(s): %s',
+        len(bundles),
+        ', '.join(bundles),
+    )
     if from_index:
         log.info('Using the existing database from %s', from_index)
         # from_index is not resolved because podman does not support digest references
@@ -495,7 +724,12 @@ def _opm_index_add(
         cmd.extend(['--overwrite-latest'])
 
     with set_registry_token(overwrite_from_index_token, from_index):
-        run_cmd(cmd, {'cwd': base_dir}, exc_msg='Failed to add the bundles to the index image')
+        run_cmd(
+            cmd,
+            {'cwd': base_dir},
+            exc_msg='Failed to add the bundles to the index image',
+            capture_stdout=False,
+        )
 
 
 @retry(attempts=2, wait_on=IIBError, logger=log)
@@ -538,7 +772,12 @@ def _opm_index_rm(base_dir, operators, binary_image, from_index, overwrite_from_
     )
 
     with set_registry_token(overwrite_from_index_token, from_index):
-        run_cmd(cmd, {'cwd': base_dir}, exc_msg='Failed to remove operators from the index image')
+        run_cmd(
+            cmd,
+            {'cwd': base_dir},
+            exc_msg='Failed to remove operators from the index image',
+            capture_stdout=False,
+        )
 
 
 def _overwrite_from_index(
@@ -647,7 +886,6 @@ def _update_index_image_build_state(request_id, prebuild_info):
     update_request(request_id, payload, exc_msg)
 
 
-@retry(wait_on=IIBError, logger=log)
 def _push_image(request_id, arch):
     """
     Push the single arch container image to the configured registry.
@@ -656,25 +894,18 @@ def _push_image(request_id, arch):
     :param str arch: the architecture of the container image to push
     :raises IIBError: if the push fails
     """
-    source = _get_local_pull_spec(request_id, arch)
+    source = _get_local_pull_spec(request_id, arch, include_transport=True)
     destination = _get_external_arch_pull_spec(request_id, arch, include_transport=True)
     log.info('Pushing the container image %s to %s', source, destination)
-    run_cmd(
-        ['podman', 'push', '-q', source, destination],
+    # skopeo reads the image directly from the local containers-storage and always writes a v2s2
+    # manifest, so there is no need to verify and fix the schema version after the push as was
+    # required with "podman push" due to RHBZ#1810768
+    _skopeo_copy(
+        source,
+        destination,
         exc_msg=f'Failed to push the container image to {destination} for the arch {arch}',
     )
 
-    log.debug(f'Verifying that {destination} was pushed as a v2 manifest due to RHBZ#1810768')
-    skopeo_raw = skopeo_inspect(destination, '--raw')
-    if skopeo_raw['schemaVersion'] != 2:
-        log.warning(
-            'The manifest for %s ended up using schema version 1 due to RHBZ#1810768. Manually '
-            'fixing it with skopeo.',
-            destination,
-        )
-        exc_msg = f'Failed to fix the manifest schema version on {destination}'
-        _skopeo_copy(destination, destination, exc_msg=exc_msg)
-
 
 @retry(wait_on=IIBError, logger=log)
 def _skopeo_copy(source, destination, copy_all=False, exc_msg=None):
@@ -694,7 +925,9 @@ def _skopeo_copy(source, destination, copy_all=False, exc_msg=None):
         cmd.append('--all')
     cmd.extend([source, destination])
 
-    run_cmd(cmd, exc_msg=exc_msg or f'Failed to copy {source} to {destination}')
+    run_cmd(
+        cmd, exc_msg=exc_msg or f'Failed to copy {source} to {destination}', capture_stdout=False,
+    )
 
 
 def _verify_index_image(
@@ -720,7 +953,10 @@ def _verify_index_image(
         )
 
 
-@app.task
+# Always acknowledge the message after the task has run and requeue it if the worker is lost,
+# regardless of the global configuration. A redelivered request skips rebuilding the arch images
+# that were already pushed, so rerunning it is cheap.
+@app.task(acks_late=True, reject_on_worker_lost=True)
 @request_logger
 def handle_add_request(
     bundles,
@@ -742,7 +978,7 @@ def handle_add_request(
     Coordinate the the work needed to build the index image with the input bundles.
 
     :param list bundles: a list of strings representing the pull specifications of the bundles to
-        add to the index image being built.
+        add to the index image being built. Duplicate pull specifications are ignored.
     :param int request_id: the ID of the IIB build request
     :param str binary_image: the pull specification of the container image where the opm binary
         gets copied from.
@@ -772,6 +1008,9 @@ def handle_add_request(
         ``cnr_token`` or ``organization`` is not specified.
     """
     _cleanup()
+    # Drop duplicate bundles so that each one is only resolved and fetched by opm once, and sort
+    # them so that the generated index image is reproducible regardless of the input order
+    bundles = sorted(set(bundles))
     # Resolve bundles to their digests
     set_request_state(request_id, 'in_progress', 'Resolving the bundles')
     resolved_bundles = get_resolved_bundles(bundles)
@@ -806,88 +1045,107 @@ def handle_add_request(
         )
 
     _update_index_image_build_state(request_id, prebuild_info)
-    present_bundles = []
-    present_bundles_pull_spec = []
-    with tempfile.TemporaryDirectory(prefix='iib-') as temp_dir:
-        if from_index:
-            msg = 'Checking if bundles are already present in index image'
-            log.info(msg)
-            set_request_state(request_id, 'in_progress', msg)
-
-            with set_registry_token(overwrite_from_index_token, from_index_resolved):
-                present_bundles, present_bundles_pull_spec = _get_present_bundles(
-                    from_index_resolved, temp_dir
-                )
+    arches = prebuild_info['arches']
+    # The arch images are pushed to a location unique to the request, so they can only exist when
+    # the request is redelivered after the worker was lost. If they were already built from the
+    # same inputs, skip straight to creating the manifest list.
+    build_inputs_key = _get_build_inputs_key(
+        resolved_bundles=resolved_bundles,
+        binary_image_resolved=prebuild_info['binary_image_resolved'],
+        from_index_resolved=from_index_resolved,
+        deprecation_list=deprecation_list,
+        ocp_version=prebuild_info['ocp_version'],
+        distribution_scope=prebuild_info['distribution_scope'],
+    )
+    redelivered = (handle_add_request.request.delivery_info or {}).get('redelivered')
+    if redelivered and _are_arch_images_built(request_id, arches, build_inputs_key):
+        log.info('The index image was already built for all the arches, skipping the build')
+    else:
+        present_bundles = []
+        present_bundles_pull_spec = []
+        with tempfile.TemporaryDirectory(prefix='iib-') as temp_dir:
+            if from_index:
+                msg = 'Checking if bundles are already present in index image'
+                log.info(msg)
+                set_request_state(request_id, 'in_progress', msg)
+
+                with set_registry_token(overwrite_from_index_token, from_index_resolved):
+                    present_bundles, present_bundles_pull_spec = _get_present_bundles(
+                        from_index_resolved, temp_dir
+                    )
 
-            filtered_bundles = _get_missing_bundles(present_bundles, resolved_bundles)
-            excluded_bundles = [
-                bundle for bundle in resolved_bundles if bundle not in filtered_bundles
-            ]
-            resolved_bundles = filtered_bundles
+                filtered_bundles = _get_missing_bundles(present_bundles, resolved_bundles)
+                filtered_bundles_set = set(filtered_bundles)
+                excluded_bundles = [
+                    bundle for bundle in resolved_bundles if bundle not in filtered_bundles_set
+                ]
+                resolved_bundles = filtered_bundles
+
+                if excluded_bundles:
+                    log.info(
+                        'Following bundles are already present in the index image: %s',
+                        ' '.join(excluded_bundles),
+                    )
 
-            if excluded_bundles:
-                log.info(
-                    'Following bundles are already present in the index image: %s',
-                    ' '.join(excluded_bundles),
-                )
+            _opm_index_add(
+                temp_dir,
+                resolved_bundles,
+                prebuild_info['binary_image_resolved'],
+                from_index_resolved,
+                overwrite_from_index_token,
+                (prebuild_info['distribution_scope'] in ['dev', 'stage']),
+            )
 
-        _opm_index_add(
-            temp_dir,
-            resolved_bundles,
-            prebuild_info['binary_image_resolved'],
-            from_index_resolved,
-            overwrite_from_index_token,
-            (prebuild_info['distribution_scope'] in ['dev', 'stage']),
-        )
+            deprecation_bundles = get_bundles_from_deprecation_list(
+                present_bundles_pull_spec + resolved_bundles, deprecation_list or []
+            )
 
-        deprecation_bundles = get_bundles_from_deprecation_list(
-            present_bundles_pull_spec + resolved_bundles, deprecation_list or []
-        )
+            if deprecation_bundles:
+                # opm can only deprecate a bundle image on an existing index image. Build and
+                # push a temporary index image to satisfy this requirement. Any arch will do.
+                arch = sorted(arches)[0]
+                log.info('Building a temporary index image to satisfy the deprecation requirement')
+                _build_image(temp_dir, 'index.Dockerfile', request_id, arch)
+                intermediate_image_name = _get_local_pull_spec(
+                    request_id, arch, include_transport=True
+                )
+                deprecate_bundles(
+                    deprecation_bundles,
+                    temp_dir,
+                    prebuild_info['binary_image'],
+                    intermediate_image_name,
+                    overwrite_from_index_token,
+                    # Use podman so opm can find the image locally
+                    container_tool='podman',
+                )
 
-        arches = prebuild_info['arches']
-        if deprecation_bundles:
-            # opm can only deprecate a bundle image on an existing index image. Build and
-            # push a temporary index image to satisfy this requirement. Any arch will do.
-            arch = sorted(arches)[0]
-            log.info('Building a temporary index image to satisfy the deprecation requirement')
-            _build_image(temp_dir, 'index.Dockerfile', request_id, arch)
-            intermediate_image_name = _get_local_pull_spec(request_id, arch, include_transport=True)
-            deprecate_bundles(
-                deprecation_bundles,
+            _add_label_to_index(
+                'com.redhat.index.delivery.version',
+                prebuild_info['ocp_version'],
                 temp_dir,
-                prebuild_info['binary_image'],
-                intermediate_image_name,
-                overwrite_from_index_token,
-                # Use podman so opm can find the image locally
-                container_tool='podman',
+                'index.Dockerfile',
             )
 
-        _add_label_to_index(
-            'com.redhat.index.delivery.version',
-            prebuild_info['ocp_version'],
-            temp_dir,
-            'index.Dockerfile',
-        )
+            _add_label_to_index(
+                'com.redhat.index.delivery.distribution_scope',
+                prebuild_info['distribution_scope'],
+                temp_dir,
+                'index.Dockerfile',
+            )
 
-        _add_label_to_index(
-            'com.redhat.index.delivery.distribution_scope',
-            prebuild_info['distribution_scope'],
-            temp_dir,
-            'index.Dockerfile',
-        )
+            _add_label_to_index(_BUILD_INPUTS_LABEL, build_inputs_key, temp_dir, 'index.Dockerfile')
 
-        for arch in sorted(arches):
-            _build_image(temp_dir, 'index.Dockerfile', request_id, arch)
-            _push_image(request_id, arch)
+            _build_and_push_images(temp_dir, 'index.Dockerfile', request_id, arches)
 
-        # If the container-tool podman is used in the opm commands above, opm will create temporary
-        # files and directories without the write permission. This will cause the context manager
-        # to fail to delete these files. Adjust the file modes to avoid this error.
-        chmod_recursively(
-            temp_dir,
-            dir_mode=(stat.S_IRWXU | stat.S_IRWXG),
-            file_mode=(stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IWGRP),
-        )
+            # If the container-tool podman is used in the opm commands above, opm will create
+            # temporary files and directories without the write permission. This will cause the
+            # context manager to fail to delete these files. Adjust the file modes to avoid this
+            # error.
+            chmod_recursively(
+                temp_dir,
+                dir_mode=(stat.S_IRWXU | stat.S_IRWXG),
+                file_mode=(stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IWGRP),
+            )
 
     set_request_state(request_id, 'in_progress', 'Creating the manifest list')
     output_pull_spec = _create_and_push_manifest_list(request_id, arches)
@@ -987,9 +1245,7 @@ def handle_rm_request(
         )
 
         arches = prebuild_info['arches']
-        for arch in sorted(arches):
-            _build_image(temp_dir, 'index.Dockerfile', request_id, arch)
-            _push_image(request_id, arch)
+        _build_and_push_images(temp_dir, 'index.Dockerfile', request_id, arches)
 
     set_request_state(request_id, 'in_progress', 'Creating the manifest list')
     output_pull_spec = _create_and_push_manifest_list(request_id, arches)
@@ -1036,12 +1292,14 @@ def _copy_files_from_image(image, src_path, dest_path):
         run_cmd(
             ['podman', 'cp', f'{container_id}:{src_path}', dest_path],
             exc_msg=f'Failed to copy the contents of {container_id}:{src_path} into {dest_path}',
+            capture_stdout=False,
         )
     finally:
         try:
             run_cmd(
                 ['podman', 'rm', container_id],
                 exc_msg=f'Failed to remove the container {container_id} for image {image}',
+                capture_stdout=False,
             )
         except IIBError as e:
             # Failure to remove the temporary container shouldn't cause the IIB request to fail.
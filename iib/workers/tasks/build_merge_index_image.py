@@ -8,6 +8,7 @@ from iib.exceptions import IIBError
 from iib.workers.api_utils import set_request_state
 from iib.workers.tasks.build import (
     _add_label_to_index,
+    _build_and_push_images,
     _build_image,
     _cleanup,
     _create_and_push_manifest_list,
@@ -71,14 +72,14 @@ def _add_bundles_missing_in_source(
     set_request_state(request_id, 'in_progress', 'Adding bundles missing in source index image')
     log.info('Adding bundles from target index image which are missing from source index image')
     missing_bundles = []
-    source_bundle_digests = []
-    source_bundle_csv_names = []
+    source_bundle_digests = set()
+    source_bundle_csv_names = set()
     target_bundle_digests = []
 
     for bundle in source_index_bundles:
         if '@sha256:' in bundle['bundlePath']:
-            source_bundle_digests.append(bundle['bundlePath'].split('@sha256:')[-1])
-            source_bundle_csv_names.append(bundle['csvName'])
+            source_bundle_digests.add(bundle['bundlePath'].split('@sha256:')[-1])
+            source_bundle_csv_names.add(bundle['csvName'])
         else:
             raise IIBError(
                 f'Bundle {bundle["bundlePath"]} in the source index image is not defined via digest'
@@ -237,9 +238,7 @@ def handle_merge_request(
                 overwrite_target_index_token,
             )
 
-        for arch in sorted(prebuild_info['arches']):
-            _build_image(temp_dir, 'index.Dockerfile', request_id, arch)
-            _push_image(request_id, arch)
+        _build_and_push_images(temp_dir, 'index.Dockerfile', request_id, prebuild_info['arches'])
 
         # If the container-tool podman is used in the opm commands above, opm will create temporary
         # files and directories without the write permission. This will cause the context manager
@@ -12,8 +12,7 @@ from iib.workers.api_utils import set_request_state, update_request
 from iib.workers.tasks.build import (
     _cleanup,
     get_image_label,
-    _build_image,
-    _push_image,
+    _build_and_push_images,
     _create_and_push_manifest_list,
     _copy_files_from_image,
 )
@@ -24,7 +23,7 @@ from iib.workers.tasks.utils import (
     podman_pull,
     request_logger,
     set_registry_auths,
-    get_image_arches,
+    get_resolved_image_and_arches,
 )
 
 
@@ -63,9 +62,7 @@ def handle_regenerate_bundle_request(
     set_request_state(request_id, 'in_progress', 'Resolving from_bundle_image')
 
     with set_registry_auths(registry_auths):
-        from_bundle_image_resolved = get_resolved_image(from_bundle_image)
-
-        arches = get_image_arches(from_bundle_image_resolved)
+        from_bundle_image_resolved, arches = get_resolved_image_and_arches(from_bundle_image)
         if not arches:
             raise IIBError(
                 'No arches were found in the resolved from_bundle_image '
@@ -112,9 +109,7 @@ def handle_regenerate_bundle_request(
                 for name, value in new_labels.items():
                     dockerfile.write(f'LABEL {name}={value}\n')
 
-            for arch in sorted(arches):
-                _build_image(temp_dir, 'Dockerfile', request_id, arch)
-                _push_image(request_id, arch)
+            _build_and_push_images(temp_dir, 'Dockerfile', request_id, arches)
 
     set_request_state(request_id, 'in_progress', 'Creating the manifest list')
     output_pull_spec = _create_and_push_manifest_list(request_id, arches)
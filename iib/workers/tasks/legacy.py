@@ -111,6 +111,7 @@ def _opm_index_export(rebuilt_index_image, package, temp_dir):
         cmd,
         {'cwd': temp_dir},
         exc_msg=f'Failed to push {package} to the legacy application registry',
+        capture_stdout=False,
     )
 
 
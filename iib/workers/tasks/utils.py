@@ -1,14 +1,18 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 import base64
+import collections
+import concurrent.futures
 from contextlib import contextmanager
 import functools
 import hashlib
 import inspect
+import io
 import json
 import logging
 import os
 import re
 import subprocess
+import threading
 
 from iib.workers.dogpile_cache import (
     create_dogpile_region,
@@ -187,7 +191,9 @@ def deprecate_bundles(
         cmd.append('--container-tool')
         cmd.append(container_tool)
     with set_registry_token(overwrite_target_index_token, from_index):
-        run_cmd(cmd, {'cwd': base_dir}, exc_msg='Failed to deprecate the bundles')
+        run_cmd(
+            cmd, {'cwd': base_dir}, exc_msg='Failed to deprecate the bundles', capture_stdout=False,
+        )
 
 
 def get_bundles_from_deprecation_list(bundles, deprecation_list):
@@ -199,7 +205,7 @@ def get_bundles_from_deprecation_list(bundles, deprecation_list):
     :return: bundles which are to be deprecated.
     :rtype: list
     """
-    resolved_deprecation_list = get_resolved_bundles(deprecation_list)
+    resolved_deprecation_list = set(get_resolved_bundles(deprecation_list))
     deprecate_bundles = []
     for bundle in bundles:
         if bundle in resolved_deprecation_list:
@@ -220,38 +226,59 @@ def get_resolved_bundles(bundles):
     If not a manifest list, it must be a v2s2 image manifest and should be used as it is.
 
     :param list bundles: the list of bundle images to be resolved.
-    :return: the list of bundle images resolved to their digests.
+    :return: the sorted list of unique bundle images resolved to their digests.
     :rtype: list
     :raises IIBError: if unable to resolve a bundle image.
     """
     log.info('Resolving bundles %s', ', '.join(bundles))
-    resolved_bundles = set()
-    for bundle_pull_spec in bundles:
-        skopeo_raw = skopeo_inspect(
-            f'docker://{bundle_pull_spec}', '--raw', require_media_type=True
-        )
-        if (
-            skopeo_raw.get('mediaType')
-            == 'application/vnd.docker.distribution.manifest.list.v2+json'
-        ):
-            # Get the digest of the first item in the manifest list
-            digest = skopeo_raw['manifests'][0]['digest']
-            name = _get_container_image_name(bundle_pull_spec)
-            resolved_bundles.add(f'{name}@{digest}')
-        elif (
-            skopeo_raw.get('mediaType') == 'application/vnd.docker.distribution.manifest.v2+json'
-            and skopeo_raw.get('schemaVersion') == 2
-        ):
-            resolved_bundles.add(get_resolved_image(bundle_pull_spec))
-        else:
-            error_msg = (
-                f'The pull specification of {bundle_pull_spec} is neither '
-                f'a v2 manifest list nor a v2s2 manifest. Type {skopeo_raw.get("mediaType")}'
-                f' and schema version {skopeo_raw.get("schemaVersion")} is not supported by IIB.'
-            )
-            raise IIBError(error_msg)
+    return sorted(set(_map_in_threads(_get_resolved_bundle, bundles)))
+
+
+def _get_resolved_bundle(bundle_pull_spec):
+    """
+    Get the pull specification of a bundle image using its digest.
+
+    :param str bundle_pull_spec: the bundle image to be resolved.
+    :return: the bundle image resolved to its digest.
+    :rtype: str
+    :raises IIBError: if unable to resolve the bundle image.
+    """
+    skopeo_raw = skopeo_inspect(f'docker://{bundle_pull_spec}', '--raw', require_media_type=True)
+    if skopeo_raw.get('mediaType') == 'application/vnd.docker.distribution.manifest.list.v2+json':
+        # Get the digest of the first item in the manifest list
+        digest = skopeo_raw['manifests'][0]['digest']
+        name = _get_container_image_name(bundle_pull_spec)
+        return f'{name}@{digest}'
+    elif (
+        skopeo_raw.get('mediaType') == 'application/vnd.docker.distribution.manifest.v2+json'
+        and skopeo_raw.get('schemaVersion') == 2
+    ):
+        return get_resolved_image(bundle_pull_spec)
+
+    error_msg = (
+        f'The pull specification of {bundle_pull_spec} is neither '
+        f'a v2 manifest list nor a v2s2 manifest. Type {skopeo_raw.get("mediaType")}'
+        f' and schema version {skopeo_raw.get("schemaVersion")} is not supported by IIB.'
+    )
+    raise IIBError(error_msg)
 
-    return list(resolved_bundles)
+
+def _map_in_threads(func, items):
+    """
+    Call a function on every item using a pool of threads.
+
+    This is meant for I/O bound work, such as inspecting container images in a registry, which
+    would otherwise be done one item at a time.
+
+    :param function func: the function to call with each item
+    :param iter items: the items to call the function with
+    :return: the results of the function in the same order as the items
+    :rtype: list
+    :raises Exception: the exception raised by the function for the first failing item
+    """
+    max_workers = get_worker_config()['iib_image_inspection_threads']
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(func, items))
 
 
 def _get_container_image_name(pull_spec):
@@ -275,11 +302,48 @@ def get_resolved_image(pull_spec):
     :return: the resolved pull specification
     :rtype: str
     """
+    if '@sha256:' in pull_spec:
+        # A digest pull specification is already resolved, so avoid querying the registry
+        log.debug('%s is already resolved', pull_spec)
+        return pull_spec
+
+    skopeo_output = skopeo_inspect(f'docker://{pull_spec}', '--raw', return_json=False)
+    return _get_resolved_image_from_manifest(pull_spec, skopeo_output, json.loads(skopeo_output))
+
+
+def get_resolved_image_and_arches(pull_spec):
+    """
+    Get the pull specification of the container image using its digest and its architectures.
+
+    The manifest of the container image is only inspected once and it's used both to compute the
+    digest and to determine the architectures.
+
+    :param str pull_spec: the pull specification of the container image to resolve
+    :return: a tuple of the resolved pull specification and the set of architectures
+    :rtype: tuple(str, set)
+    :raises IIBError: if the pull specification is not a v2 manifest list nor a v2 manifest
+    """
+    skopeo_output = skopeo_inspect(f'docker://{pull_spec}', '--raw', return_json=False)
+    manifest = json.loads(skopeo_output)
+    pull_spec_resolved = _get_resolved_image_from_manifest(pull_spec, skopeo_output, manifest)
+    log.debug('Get the available arches for %s', pull_spec_resolved)
+    return pull_spec_resolved, _get_image_arches_from_manifest(pull_spec_resolved, manifest)
+
+
+def _get_resolved_image_from_manifest(pull_spec, raw_manifest, manifest):
+    """
+    Get the pull specification of the container image using the digest of its manifest.
+
+    :param str pull_spec: the pull specification of the container image to resolve
+    :param str raw_manifest: the manifest as returned by ``skopeo inspect --raw``
+    :param dict manifest: the parsed ``raw_manifest``
+    :return: the resolved pull specification
+    :rtype: str
+    """
     log.debug('Resolving %s', pull_spec)
     name = _get_container_image_name(pull_spec)
-    skopeo_output = skopeo_inspect(f'docker://{pull_spec}', '--raw', return_json=False)
-    if json.loads(skopeo_output).get('schemaVersion') == 2:
-        raw_digest = hashlib.sha256(skopeo_output.encode('utf-8')).hexdigest()
+    if manifest.get('schemaVersion') == 2:
+        raw_digest = hashlib.sha256(raw_manifest.encode('utf-8')).hexdigest()
         digest = f'sha256:{raw_digest}'
     else:
         # Schema 1 is not a stable format. The contents of the manifest may change slightly
@@ -494,17 +558,25 @@ def podman_pull(*args):
     run_cmd(
         ['podman', 'pull'] + list(args),
         exc_msg=f'Failed to pull the container image {" ".join(args)}',
+        capture_stdout=False,
     )
 
 
-def run_cmd(cmd, params=None, exc_msg=None):
+def run_cmd(cmd, params=None, exc_msg=None, capture_stdout=True, log_failure=True):
     """
     Run the given command with the provided parameters.
 
+    The standard error of the command is logged line by line while the command runs. Only its last
+    lines are kept in memory to report a failure, so verbose commands don't buffer all their output.
+
     :param iter cmd: iterable representing the command to be executed
     :param dict params: keyword parameters for command execution
     :param str exc_msg: an optional exception message when the command fails
-    :return: the command output
+    :param bool capture_stdout: if ``False``, the standard output of the command is discarded
+        instead of being read and returned. Use this for commands whose output isn't needed.
+    :param bool log_failure: if ``False``, a failure of the command is not logged as an error. Use
+        this for commands that are expected to fail, such as checking if an image exists.
+    :return: the command output or ``None`` if ``capture_stdout`` is ``False``
     :rtype: str
     :raises IIBError: if the command fails
     """
@@ -514,25 +586,49 @@ def run_cmd(cmd, params=None, exc_msg=None):
     params.setdefault('universal_newlines', True)
     params.setdefault('encoding', 'utf-8')
     params.setdefault('stderr', subprocess.PIPE)
-    params.setdefault('stdout', subprocess.PIPE)
+    params.setdefault('stdout', subprocess.PIPE if capture_stdout else subprocess.DEVNULL)
 
     log.debug('Running the command "%s"', ' '.join(cmd))
-    response = subprocess.run(cmd, **params)
-
-    if response.returncode != 0:
-        log.error('The command "%s" failed with: %s', ' '.join(cmd), response.stderr)
+    stderr_tail = collections.deque(maxlen=200)
+
+    def _consume_stderr(stderr):
+        for line in stderr:
+            line = line.rstrip('\n')
+            log.debug('%s: %s', cmd[0], line)
+            stderr_tail.append(line)
+
+    with subprocess.Popen(cmd, **params) as process:
+        # Read the standard error in a separate thread so that neither pipe can fill up and block
+        # the command while the other one is being read
+        stderr_reader = None
+        if process.stderr:
+            stderr = process.stderr
+            if isinstance(stderr, io.TextIOWrapper):
+                # Replace the undecodable bytes so that the reader thread can't fail and stop
+                # draining the pipe, which would block the command forever
+                stderr = io.TextIOWrapper(stderr.buffer, encoding=stderr.encoding, errors='replace')
+            stderr_reader = threading.Thread(target=_consume_stderr, args=(stderr,))
+            stderr_reader.start()
+        output = process.stdout.read() if process.stdout else None
+        if stderr_reader:
+            stderr_reader.join()
+        returncode = process.wait()
+
+    if returncode != 0:
+        if log_failure:
+            log.error('The command "%s" failed with: %s', ' '.join(cmd), '\n'.join(stderr_tail))
         if cmd[0] == 'opm':
             # Capture the error message right before the help display
             regex = r'^(?:Error: )(.+)$'
             # Start from the last log message since the failure occurs near the bottom
-            for msg in reversed(response.stderr.splitlines()):
+            for msg in reversed(stderr_tail):
                 match = re.match(regex, msg)
                 if match:
                     raise IIBError(f'{exc_msg.rstrip(".")}: {match.groups()[0]}')
 
         raise IIBError(exc_msg)
 
-    return response.stdout
+    return output
 
 
 def request_logger(func):
@@ -640,22 +736,21 @@ def gather_index_image_arches(build_request_config, index_image_infos):
     return arches
 
 
-def get_image_arches(pull_spec):
+def _get_image_arches_from_manifest(pull_spec, manifest):
     """
-    Get the architectures this image was built for.
+    Get the architectures this image was built for from its manifest.
 
-    :param str pull_spec: the pull specification to a v2 manifest list
+    :param str pull_spec: the pull specification of the container image
+    :param dict manifest: the parsed output of ``skopeo inspect --raw`` for ``pull_spec``
     :return: a set of architectures of the container images contained in the manifest list
     :rtype: set
-    :raises IIBError: if the pull specification is not a v2 manifest list
+    :raises IIBError: if the manifest is not a v2 manifest list nor a v2 manifest
     """
-    log.debug('Get the available arches for %s', pull_spec)
-    skopeo_raw = skopeo_inspect(f'docker://{pull_spec}', '--raw')
     arches = set()
-    if skopeo_raw.get('mediaType') == 'application/vnd.docker.distribution.manifest.list.v2+json':
-        for manifest in skopeo_raw['manifests']:
-            arches.add(manifest['platform']['architecture'])
-    elif skopeo_raw.get('mediaType') == 'application/vnd.docker.distribution.manifest.v2+json':
+    if manifest.get('mediaType') == 'application/vnd.docker.distribution.manifest.list.v2+json':
+        for image_manifest in manifest['manifests']:
+            arches.add(image_manifest['platform']['architecture'])
+    elif manifest.get('mediaType') == 'application/vnd.docker.distribution.manifest.v2+json':
         skopeo_out = skopeo_inspect(f'docker://{pull_spec}', '--config')
         arches.add(skopeo_out['architecture'])
     else:
@@ -688,14 +783,11 @@ def get_index_image_info(overwrite_from_index_token, from_index=None, default_oc
         return result
 
     with set_registry_token(overwrite_from_index_token, from_index):
-        from_index_resolved = get_resolved_image(from_index)
-        result['arches'] = get_image_arches(from_index_resolved)
-        result['ocp_version'] = (
-            get_image_label(from_index_resolved, 'com.redhat.index.delivery.version') or 'v4.5'
-        )
+        from_index_resolved, result['arches'] = get_resolved_image_and_arches(from_index)
+        labels = get_image_labels(from_index_resolved)
+        result['ocp_version'] = labels.get('com.redhat.index.delivery.version') or 'v4.5'
         result['resolved_distribution_scope'] = (
-            get_image_label(from_index_resolved, 'com.redhat.index.delivery.distribution_scope')
-            or 'prod'
+            labels.get('com.redhat.index.delivery.distribution_scope') or 'prod'
         )
         result['resolved_from_index'] = from_index_resolved
     return result
@@ -751,8 +843,7 @@ def verify_labels(bundles):
     if not conf['iib_required_labels']:
         return
 
-    for bundle in bundles:
-        labels = get_image_labels(bundle)
+    for bundle, labels in zip(bundles, _map_in_threads(get_image_labels, bundles)):
         for label, value in conf['iib_required_labels'].items():
             if labels.get(label) != value:
                 raise IIBError(f'The bundle {bundle} does not have the label {label}={value}')
@@ -834,8 +925,7 @@ def prepare_request_for_build(request_id, build_request_config):
 
     binary_image = build_request_config.binary_image(index_info['from_index'], distribution_scope)
 
-    binary_image_resolved = get_resolved_image(binary_image)
-    binary_image_arches = get_image_arches(binary_image_resolved)
+    binary_image_resolved, binary_image_arches = get_resolved_image_and_arches(binary_image)
 
     if not arches.issubset(binary_image_arches):
         raise IIBError(
@@ -1388,14 +1388,18 @@ def test_regenerate_bundle_batch_success(
                 args=['registry.example.com/bundle-image:latest', None, 1],
                 link_error=mock.ANY,
                 queue=expected_queue,
+                producer=mock.ANY,
             ),
             mock.call(
                 args=['registry.example.com/bundle-image2:latest', None, 2],
                 link_error=mock.ANY,
                 queue=expected_queue,
+                producer=mock.ANY,
             ),
         )
     )
+    # All the tasks of the batch are published with the same producer
+    assert len({c[1]['producer'] for c in mock_hrbr.apply_async.call_args_list}) == 1
     assert len(rv.json) == 2
     assert all(r['batch_annotations'] == annotations for r in rv.json)
 
@@ -1514,6 +1518,7 @@ def test_add_rm_batch_success(mock_smfnbor, mock_hrr, mock_har, app, auth_env, c
                 ),
                 link_error=mock.ANY,
                 queue=None,
+                producer=mock.ANY,
             ),
         )
     )
@@ -1538,6 +1543,7 @@ def test_add_rm_batch_success(mock_smfnbor, mock_hrr, mock_har, app, auth_env, c
                 ),
                 link_error=mock.ANY,
                 queue=None,
+                producer=mock.ANY,
             ),
         )
     )
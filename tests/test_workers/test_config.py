@@ -67,6 +67,64 @@ def test_validate_celery_config_iib_required_labels_not_dict():
         validate_celery_config(conf)
 
 
+def test_validate_celery_config_invalid_manifest_list_tool():
+    conf = {
+        'iib_api_url': 'http://localhost:8080/api/v1/',
+        'iib_manifest_list_tool': 'podman',
+        'iib_registry': 'registry',
+        'iib_required_labels': {},
+    }
+    with pytest.raises(ConfigError, match='iib_manifest_list_tool must be one of'):
+        validate_celery_config(conf)
+
+
+@pytest.mark.parametrize('threshold', (-0.1, 1.5, '0.2'))
+def test_validate_celery_config_invalid_cleanup_free_threshold(threshold):
+    conf = {
+        'iib_api_url': 'http://localhost:8080/api/v1/',
+        'iib_cleanup_free_threshold': threshold,
+        'iib_registry': 'registry',
+        'iib_required_labels': {},
+    }
+    with pytest.raises(ConfigError, match='iib_cleanup_free_threshold must be a number'):
+        validate_celery_config(conf)
+
+
+@pytest.mark.parametrize('threads', (0, -1, '5', 2.5, True))
+def test_validate_celery_config_invalid_image_inspection_threads(threads):
+    conf = {
+        'iib_api_url': 'http://localhost:8080/api/v1/',
+        'iib_image_inspection_threads': threads,
+        'iib_registry': 'registry',
+        'iib_required_labels': {},
+    }
+    with pytest.raises(ConfigError, match='iib_image_inspection_threads must be a positive'):
+        validate_celery_config(conf)
+
+
+def test_validate_celery_config_missing_build_tmpdir(tmpdir):
+    conf = {
+        'iib_api_url': 'http://localhost:8080/api/v1/',
+        'iib_build_tmpdir': str(tmpdir.join('missing')),
+        'iib_registry': 'registry',
+        'iib_required_labels': {},
+    }
+    with pytest.raises(ConfigError, match='iib_build_tmpdir, .+, must exist and be a directory'):
+        validate_celery_config(conf)
+
+
+def test_validate_celery_config_missing_container_storage_path(tmpdir):
+    conf = {
+        'iib_api_url': 'http://localhost:8080/api/v1/',
+        'iib_cleanup_free_threshold': 0.2,
+        'iib_container_storage_path': str(tmpdir.join('missing')),
+        'iib_registry': 'registry',
+        'iib_required_labels': {},
+    }
+    with pytest.raises(ConfigError, match='iib_container_storage_path, .+, must exist'):
+        validate_celery_config(conf)
+
+
 @pytest.mark.parametrize(
     'config, error',
     (
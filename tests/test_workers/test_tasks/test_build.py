@@ -12,6 +12,7 @@ from iib.exceptions import IIBError
 from iib.workers.tasks import build
 from iib.workers.tasks.utils import RequestConfigAddRm
 
+
 @mock.patch('iib.workers.tasks.build.run_cmd')
 def test_build_image(mock_run_cmd):
     build._build_image('/some/dir', 'some.Dockerfile', 3, 'amd64')
@@ -20,6 +21,51 @@ def test_build_image(mock_run_cmd):
     build_args = mock_run_cmd.call_args[0][0]
     assert build_args[0:2] == ['buildah', 'bud']
     assert '/some/dir/some.Dockerfile' in build_args
+    assert 'env' not in mock_run_cmd.call_args[0][1]
+
+
+@mock.patch('iib.workers.tasks.build.get_worker_config')
+@mock.patch('iib.workers.tasks.build.run_cmd')
+def test_build_image_custom_tmpdir(mock_run_cmd, mock_gwc, tmpdir):
+    mock_gwc.return_value.iib_build_tmpdir = str(tmpdir)
+
+    build._build_image('/some/dir', 'some.Dockerfile', 3, 'amd64')
+
+    mock_run_cmd.assert_called_once()
+    build_tmpdir = mock_run_cmd.call_args[0][1]['env']['TMPDIR']
+    assert os.path.dirname(build_tmpdir) == str(tmpdir)
+    assert os.path.basename(build_tmpdir).startswith('iib-3-amd64-')
+    # The temporary directory is removed after the build
+    assert not os.path.exists(build_tmpdir)
+
+
+@mock.patch('iib.workers.tasks.build._push_image')
+@mock.patch('iib.workers.tasks.build._build_image')
+def test_build_and_push_images(mock_bi, mock_pi):
+    build._build_and_push_images('/some/dir', 'some.Dockerfile', 3, {'amd64', 's390x'})
+
+    assert mock_bi.call_count == 2
+    mock_bi.assert_any_call('/some/dir', 'some.Dockerfile', 3, 'amd64')
+    mock_bi.assert_any_call('/some/dir', 'some.Dockerfile', 3, 's390x')
+    assert mock_pi.call_count == 2
+    mock_pi.assert_any_call(3, 'amd64')
+    mock_pi.assert_any_call(3, 's390x')
+
+
+@mock.patch('iib.workers.tasks.build._push_image')
+@mock.patch('iib.workers.tasks.build._build_image')
+def test_build_and_push_images_failure(mock_bi, mock_pi):
+    def _build_image(dockerfile_dir, dockerfile_name, request_id, arch):
+        if arch == 's390x':
+            raise IIBError('Failed to build the container image on the arch s390x')
+
+    mock_bi.side_effect = _build_image
+
+    with pytest.raises(IIBError, match='Failed to build the container image on the arch s390x'):
+        build._build_and_push_images('/some/dir', 'some.Dockerfile', 3, {'amd64', 's390x'})
+
+    # The other architectures are still built and pushed
+    mock_pi.assert_called_once_with(3, 'amd64')
 
 
 @mock.patch('iib.workers.tasks.build.run_cmd')
@@ -33,6 +79,33 @@ def test_cleanup(mock_rdc, mock_run_cmd):
     mock_rdc.assert_called_once_with()
 
 
+@pytest.mark.parametrize('free, pruned', ((50, False), (20, True), (10, True)))
+@mock.patch('iib.workers.tasks.build.get_worker_config')
+@mock.patch('iib.workers.tasks.build.shutil.disk_usage')
+@mock.patch('iib.workers.tasks.build.run_cmd')
+@mock.patch('iib.workers.tasks.build.reset_docker_config')
+def test_cleanup_free_threshold(mock_rdc, mock_run_cmd, mock_du, mock_gwc, free, pruned):
+    mock_gwc.return_value = {
+        'iib_cleanup_free_threshold': 0.2,
+        'iib_cleanup_image_age': '24h',
+        'iib_container_storage_path': '/var/lib/containers',
+    }
+    mock_du.return_value = mock.Mock(total=100, used=100 - free, free=free)
+
+    build._cleanup()
+
+    mock_du.assert_called_once_with('/var/lib/containers')
+    if pruned:
+        mock_run_cmd.assert_called_once_with(
+            ['podman', 'image', 'prune', '--all', '--force', '--filter', 'until=24h'],
+            exc_msg='Failed to remove the existing container images',
+            capture_stdout=False,
+        )
+    else:
+        mock_run_cmd.assert_not_called()
+    mock_rdc.assert_called_once_with()
+
+
 @mock.patch('iib.workers.tasks.build.tempfile.TemporaryDirectory')
 @mock.patch('iib.workers.tasks.build.run_cmd')
 def test_create_and_push_manifest_list(mock_run_cmd, mock_td, tmp_path):
@@ -63,6 +136,82 @@ def test_create_and_push_manifest_list(mock_run_cmd, mock_td, tmp_path):
     assert manifest in manifest_tool_args
 
 
+@mock.patch('iib.workers.tasks.build.get_worker_config')
+@mock.patch('iib.workers.tasks.build.run_cmd')
+def test_create_and_push_manifest_list_buildah(mock_run_cmd, mock_gwc):
+    mock_gwc.return_value = {
+        'iib_image_push_template': '{registry}/iib-build:{request_id}',
+        'iib_manifest_list_tool': 'buildah',
+        'iib_registry': 'registry:8443',
+    }
+
+    rv = build._create_and_push_manifest_list(3, {'amd64', 's390x'})
+
+    assert rv == 'registry:8443/iib-build:3'
+    assert [c[0][0] for c in mock_run_cmd.call_args_list] == [
+        ['buildah', 'rmi', 'iib-build-manifest-list:3'],
+        ['buildah', 'manifest', 'create', 'iib-build-manifest-list:3'],
+        [
+            'buildah',
+            'manifest',
+            'add',
+            '--arch',
+            'amd64',
+            '--os',
+            'linux',
+            'iib-build-manifest-list:3',
+            'docker://registry:8443/iib-build:3-amd64',
+        ],
+        [
+            'buildah',
+            'manifest',
+            'add',
+            '--arch',
+            's390x',
+            '--os',
+            'linux',
+            'iib-build-manifest-list:3',
+            'docker://registry:8443/iib-build:3-s390x',
+        ],
+        [
+            'buildah',
+            'manifest',
+            'push',
+            '--format',
+            'v2s2',
+            'iib-build-manifest-list:3',
+            'docker://registry:8443/iib-build:3',
+        ],
+        ['buildah', 'rmi', 'iib-build-manifest-list:3'],
+    ]
+
+
+@mock.patch('iib.workers.tasks.build.get_worker_config')
+@mock.patch('iib.workers.tasks.build.run_cmd')
+def test_create_and_push_manifest_list_buildah_push_failed(mock_run_cmd, mock_gwc):
+    mock_gwc.return_value = {
+        'iib_image_push_template': '{registry}/iib-build:{request_id}',
+        'iib_manifest_list_tool': 'buildah',
+        'iib_registry': 'registry:8443',
+    }
+    mock_run_cmd.side_effect = lambda cmd, *args, **kwargs: _fail_manifest_push(cmd)
+
+    with pytest.raises(IIBError, match='Failed to push the manifest list'):
+        build._create_and_push_manifest_list_with_buildah('registry:8443/iib-build:3', 3, {'amd64'})
+
+    # The failure to remove a leftover manifest list beforehand is ignored
+    assert mock_run_cmd.call_args_list[0][0][0] == ['buildah', 'rmi', 'iib-build-manifest-list:3']
+    assert mock_run_cmd.call_args_list[1][0][0][:3] == ['buildah', 'manifest', 'create']
+    assert mock_run_cmd.call_args[0][0] == ['buildah', 'rmi', 'iib-build-manifest-list:3']
+
+
+def _fail_manifest_push(cmd):
+    if cmd[:3] == ['buildah', 'manifest', 'push']:
+        raise IIBError('Failed to push the manifest list to registry:8443/iib-build:3')
+    if cmd[:2] == ['buildah', 'rmi']:
+        raise IIBError('Failed to remove the manifest list')
+
+
 @pytest.mark.parametrize(
     'iib_index_image_output_registry, from_index, overwrite, expected, resolved_from_index,'
     'add_or_rm',
@@ -319,27 +468,15 @@ def test_update_index_image_build_state(mock_ur, bundle_mapping, from_index_reso
     mock_ur.assert_called_once_with(request_id, expected_payload, mock.ANY)
 
 
-@pytest.mark.parametrize('schema_version', (1, 2))
-@mock.patch('iib.workers.tasks.build._get_local_pull_spec')
-@mock.patch('iib.workers.tasks.build.run_cmd')
-@mock.patch('iib.workers.tasks.build.skopeo_inspect')
 @mock.patch('iib.workers.tasks.build._skopeo_copy')
-def test_push_image(mock_sc, mock_si, mock_run_cmd, mock_glps, schema_version):
-    mock_glps.return_value = 'source:tag'
-    mock_si.return_value = {'schemaVersion': schema_version}
-
+def test_push_image(mock_sc):
     build._push_image(3, 'amd64')
 
-    push_args = mock_run_cmd.mock_calls[0][1][0]
-    assert push_args[0:2] == ['podman', 'push']
-    assert 'source:tag' in push_args
-    destination = 'docker://registry:8443/iib-build:3-amd64'
-    assert destination in push_args
-
-    if schema_version == 1:
-        mock_sc.assert_called_once()
-    else:
-        mock_run_cmd.assert_called_once()
+    mock_sc.assert_called_once_with(
+        'containers-storage:localhost/iib-build:3-amd64',
+        'docker://registry:8443/iib-build:3-amd64',
+        exc_msg=mock.ANY,
+    )
 
 
 @pytest.mark.parametrize('copy_all', (False, True))
@@ -390,6 +527,7 @@ def test_skopeo_copy_fail_max_retries(mock_run_cmd):
 )
 @pytest.mark.parametrize('distribution_scope', ('dev', 'stage', 'prod'))
 @pytest.mark.parametrize('deprecate_bundles', (True, False))
+@mock.patch('iib.workers.tasks.build._are_arch_images_built', return_value=False)
 @mock.patch('iib.workers.tasks.build.deprecate_bundles')
 @mock.patch('iib.workers.tasks.utils.get_resolved_bundles')
 @mock.patch('iib.workers.tasks.build._cleanup')
@@ -435,6 +573,7 @@ def test_handle_add_request(
     mock_cleanup,
     mock_ugrb,
     mock_dep_b,
+    mock_aaib,
     force_backport,
     binary_image,
     distribution_scope,
@@ -456,7 +595,7 @@ def test_handle_add_request(
     output_pull_spec = 'quay.io/namespace/some-image:3'
     mock_capml.return_value = output_pull_spec
     mock_gpb.return_value = [{'bundlePath': 'random_bundle@sha'}], ['random_bundle@sha']
-    bundles = ['some-bundle:2.3-1', 'some-deprecation-bundle:1.1-1']
+    bundles = ['some-deprecation-bundle:1.1-1', 'some-bundle:2.3-1', 'some-bundle:2.3-1']
     cnr_token = 'token'
     organization = 'org'
     greenwave_config = {'some_key': 'other_value'}
@@ -494,6 +633,7 @@ def test_handle_add_request(
     )
 
     mock_cleanup.assert_called_once()
+    mock_grb.assert_called_once_with(['some-bundle:2.3-1', 'some-deprecation-bundle:1.1-1'])
     mock_vl.assert_called_once()
     mock_prfb.assert_called_once_with(
         3,
@@ -508,7 +648,9 @@ def test_handle_add_request(
         ),
     )
     mock_gb.assert_called_once()
-    assert 2 == mock_alti.call_count
+    assert 3 == mock_alti.call_count
+    # The arch images are only checked when the request is redelivered
+    mock_aaib.assert_not_called()
     mock_glsp.assert_called_once_with(
         ['some-bundle@sha', 'some-deprecation-bundle@sha'], 3, 'v4.5', force_backport=force_backport
     )
@@ -676,7 +818,99 @@ def test_handle_add_request_check_index_label_behavior(
     )
     # Assert the labels are set again once they were wiped out
     assert label_state['LABEL_SET'] == 'setting_label_in_add_label_to_index'
-    assert mock_alti.call_count == 2
+    assert mock_alti.call_count == 3
+
+
+@mock.patch('iib.workers.tasks.build._cleanup')
+@mock.patch('iib.workers.tasks.build.get_resolved_bundles')
+@mock.patch('iib.workers.tasks.build.verify_labels')
+@mock.patch('iib.workers.tasks.build.prepare_request_for_build')
+@mock.patch('iib.workers.tasks.build.get_legacy_support_packages')
+@mock.patch('iib.workers.tasks.build._update_index_image_build_state')
+@mock.patch('iib.workers.tasks.build._are_arch_images_built')
+@mock.patch('iib.workers.tasks.build._opm_index_add')
+@mock.patch('iib.workers.tasks.build._build_and_push_images')
+@mock.patch('iib.workers.tasks.build.set_request_state')
+@mock.patch('iib.workers.tasks.build._create_and_push_manifest_list')
+@mock.patch('iib.workers.tasks.build._update_index_image_pull_spec')
+def test_handle_add_request_already_built(
+    mock_uiips,
+    mock_capml,
+    mock_srs,
+    mock_bapi,
+    mock_oia,
+    mock_aaib,
+    mock_uiibs,
+    mock_glsp,
+    mock_prfb,
+    mock_vl,
+    mock_grb,
+    mock_cleanup,
+):
+    arches = {'amd64', 's390x'}
+    mock_prfb.return_value = {
+        'arches': arches,
+        'binary_image': 'binary-image:latest',
+        'binary_image_resolved': 'binary-image@sha256:abcdef',
+        'from_index_resolved': 'from-index@sha256:bcdefg',
+        'ocp_version': 'v4.6',
+        'distribution_scope': 'prod',
+    }
+    mock_grb.return_value = ['some-bundle@sha']
+    mock_glsp.return_value = set()
+    mock_aaib.return_value = True
+    mock_capml.return_value = 'registry:8443/iib-build:3'
+
+    build.handle_add_request.push_request(delivery_info={'redelivered': True})
+    try:
+        build.handle_add_request.run(['some-bundle:2.3-1'], 3, None, 'from-index:latest')
+    finally:
+        build.handle_add_request.pop_request()
+
+    mock_aaib.assert_called_once_with(3, arches, mock.ANY)
+    mock_oia.assert_not_called()
+    mock_bapi.assert_not_called()
+    mock_capml.assert_called_once_with(3, arches)
+    mock_uiips.assert_called_once()
+
+
+def test_handle_add_request_acks_late():
+    assert build.handle_add_request.acks_late is True
+    assert build.handle_add_request.reject_on_worker_lost is True
+
+
+def test_get_build_inputs_key():
+    key = build._get_build_inputs_key(bundles=['b@sha256:2', 'a@sha256:1'], from_index=None)
+
+    assert key == build._get_build_inputs_key(from_index=None, bundles=['a@sha256:1', 'b@sha256:2'])
+    assert key != build._get_build_inputs_key(bundles=['a@sha256:1'], from_index=None)
+
+
+@pytest.mark.parametrize(
+    'run_cmd_side_effect, expected',
+    (
+        (['{"config": {"Labels": {"com.redhat.iib.build-inputs": "key"}}}'] * 2, True),
+        (
+            [
+                '{"config": {"Labels": {"com.redhat.iib.build-inputs": "key"}}}',
+                '{"config": {"Labels": {"com.redhat.iib.build-inputs": "other-key"}}}',
+            ],
+            False,
+        ),
+        (['{"config": {"Labels": null}}'], False),
+        (IIBError('Failed to inspect'), False),
+    ),
+)
+@mock.patch('iib.workers.tasks.build.run_cmd')
+def test_are_arch_images_built(mock_run_cmd, run_cmd_side_effect, expected):
+    mock_run_cmd.side_effect = run_cmd_side_effect
+
+    assert build._are_arch_images_built(3, {'amd64', 's390x'}, 'key') is expected
+    assert mock_run_cmd.call_args_list[0][0][0][-2:] == [
+        '--config',
+        'docker://registry:8443/iib-build:3-amd64',
+    ]
+    assert mock_run_cmd.call_args_list[0][1]['log_failure'] is False
 
 
 @mock.patch('iib.workers.tasks.build._cleanup')
@@ -929,8 +1163,12 @@ def test_copy_files_from_image(mock_podman_pull, mock_run_cmd, fail_rm):
     mock_run_cmd.assert_has_calls(
         [
             mock.call(['podman', 'create', image, 'unused'], exc_msg=mock.ANY),
-            mock.call(['podman', 'cp', f'{container_id}:{src_path}', dest_path], exc_msg=mock.ANY),
-            mock.call(['podman', 'rm', container_id], exc_msg=mock.ANY),
+            mock.call(
+                ['podman', 'cp', f'{container_id}:{src_path}', dest_path],
+                exc_msg=mock.ANY,
+                capture_stdout=False,
+            ),
+            mock.call(['podman', 'rm', container_id], exc_msg=mock.ANY, capture_stdout=False),
         ]
     )
 
@@ -1119,6 +1357,15 @@ def test_get_present_bundles_grpc_delayed_initialize(
     ]
     assert bundles_pull_spec == ['bundle1', 'bundle2']
     assert mock_run_cmd.call_count == 8
+    # The polling interval backs off exponentially, is capped at a second and is reset when the
+    # service is restarted
+    assert [c[0][0] for c in mock_sleep.call_args_list[:6]] == [0.1, 0.2, 0.4, 0.8, 1, 0.1]
+    # The failed readiness probes are expected and not logged as errors
+    probe_calls = [
+        c for c in mock_run_cmd.call_args_list if c[0][0][-2:] == ['list', 'api.Registry']
+    ]
+    assert len(probe_calls) == 7
+    assert all(c[1] == {'log_failure': False} for c in probe_calls)
 
 
 @mock.patch('time.sleep')
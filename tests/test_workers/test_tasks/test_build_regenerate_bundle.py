@@ -24,14 +24,13 @@ yaml = build_regenerate_bundle.yaml
 )
 @mock.patch('iib.workers.tasks.build_regenerate_bundle.get_image_label')
 @mock.patch('iib.workers.tasks.build_regenerate_bundle._cleanup')
-@mock.patch('iib.workers.tasks.build_regenerate_bundle.get_resolved_image')
+@mock.patch('iib.workers.tasks.build_regenerate_bundle.get_resolved_image_and_arches')
 @mock.patch('iib.workers.tasks.build_regenerate_bundle.podman_pull')
 @mock.patch('iib.workers.tasks.build_regenerate_bundle.tempfile.TemporaryDirectory')
-@mock.patch('iib.workers.tasks.build_regenerate_bundle.get_image_arches')
 @mock.patch('iib.workers.tasks.build_regenerate_bundle._copy_files_from_image')
 @mock.patch('iib.workers.tasks.build_regenerate_bundle._adjust_operator_bundle')
-@mock.patch('iib.workers.tasks.build_regenerate_bundle._build_image')
-@mock.patch('iib.workers.tasks.build_regenerate_bundle._push_image')
+@mock.patch('iib.workers.tasks.build._build_image')
+@mock.patch('iib.workers.tasks.build._push_image')
 @mock.patch('iib.workers.tasks.build_regenerate_bundle.set_request_state')
 @mock.patch('iib.workers.tasks.build_regenerate_bundle._create_and_push_manifest_list')
 @mock.patch('iib.workers.tasks.build_regenerate_bundle.get_worker_config')
@@ -45,10 +44,9 @@ def test_handle_regenerate_bundle_request(
     mock_bi,
     mock_aob,
     mock_cffi,
-    mock_gia,
     mock_temp_dir,
     mock_pp,
-    mock_gri,
+    mock_griaa,
     mock_cleanup,
     mock_gil,
     iib_index_image_output_registry,
@@ -65,8 +63,7 @@ def test_handle_regenerate_bundle_request(
     request_id = 99
 
     mock_temp_dir.return_value.__enter__.return_value = str(tmpdir)
-    mock_gri.return_value = from_bundle_image_resolved
-    mock_gia.return_value = list(arches)
+    mock_griaa.return_value = (from_bundle_image_resolved, list(arches))
     mock_aob.return_value = {'operators.operatorframework.io.bundle.package.v1': 'amqstreams-cmp'}
     mock_capml.return_value = bundle_image
     mock_gwc.return_value = {
@@ -81,14 +78,10 @@ def test_handle_regenerate_bundle_request(
 
     mock_cleanup.assert_called_once()
 
-    mock_gri.assert_called_once()
-    mock_gri.assert_called_with('bundle-image:latest')
+    mock_griaa.assert_called_once_with('bundle-image:latest')
 
     mock_pp.assert_called_once_with(from_bundle_image_resolved)
 
-    mock_gia.assert_called_once()
-    mock_gia.assert_called_with('bundle-image@sha256:abcdef')
-
     assert mock_cffi.call_count == 2
     mock_cffi.assert_has_calls(
         (
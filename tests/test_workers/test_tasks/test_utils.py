@@ -1,7 +1,9 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
+import io
 import logging
 import os
 import stat
+import sys
 import textwrap
 from unittest import mock
 
@@ -206,37 +208,93 @@ def test_retry():
     assert mock_func.call_count == 3
 
 
-@mock.patch('iib.workers.tasks.utils.subprocess.run')
-def test_run_cmd(mock_sub_run):
-    mock_rv = mock.Mock()
-    mock_rv.returncode = 0
-    mock_sub_run.return_value = mock_rv
+def _mock_popen_process(mock_popen, returncode, stdout='', stderr=''):
+    process = mock_popen.return_value.__enter__.return_value
+    process.stdout = io.StringIO(stdout)
+    process.stderr = io.StringIO(stderr)
+    process.wait.return_value = returncode
+    return process
 
-    utils.run_cmd(['echo', 'hello world'], {'cwd': '/some/path'})
 
-    mock_sub_run.assert_called_once()
+@mock.patch('iib.workers.tasks.utils.subprocess.Popen')
+def test_run_cmd(mock_popen):
+    _mock_popen_process(mock_popen, 0, stdout='hello world\n', stderr='some warning\n')
+
+    rv = utils.run_cmd(['echo', 'hello world'], {'cwd': '/some/path'})
+
+    assert rv == 'hello world\n'
+    mock_popen.assert_called_once()
+    assert mock_popen.call_args[1]['cwd'] == '/some/path'
+
+
+@mock.patch('iib.workers.tasks.utils.subprocess.Popen')
+def test_run_cmd_discard_stdout(mock_popen):
+    process = _mock_popen_process(mock_popen, 0)
+    process.stdout = None
+
+    rv = utils.run_cmd(['echo', 'hello world'], capture_stdout=False)
+
+    assert rv is None
+    assert mock_popen.call_args[1]['stdout'] == utils.subprocess.DEVNULL
+
+
+def test_run_cmd_undecodable_stderr():
+    # Write enough to stderr to fill the pipe after the undecodable byte
+    script = (
+        'import sys; '
+        'sys.stderr.buffer.write(b"\\xff\\n" + b"x" * 200000 + b"\\n"); '
+        'sys.stdout.write("done")'
+    )
+
+    assert utils.run_cmd([sys.executable, '-c', script]) == 'done'
 
 
 @pytest.mark.parametrize('exc_msg', (None, 'Houston, we have a problem!'))
-@mock.patch('iib.workers.tasks.utils.subprocess.run')
-def test_run_cmd_failed(mock_sub_run, exc_msg):
-    mock_rv = mock.Mock()
-    mock_rv.returncode = 1
-    mock_rv.stderr = 'some failure'
-    mock_sub_run.return_value = mock_rv
+@mock.patch('iib.workers.tasks.utils.subprocess.Popen')
+def test_run_cmd_failed(mock_popen, exc_msg):
+    _mock_popen_process(mock_popen, 1, stderr='some failure\n')
 
     expected_exc = exc_msg or 'An unexpected error occurred'
     with pytest.raises(IIBError, match=expected_exc):
         utils.run_cmd(['echo', 'hello'], exc_msg=exc_msg)
 
-    mock_sub_run.assert_called_once()
+    mock_popen.assert_called_once()
+
+
+@pytest.mark.parametrize('log_failure', (True, False))
+@mock.patch('iib.workers.tasks.utils.log')
+@mock.patch('iib.workers.tasks.utils.subprocess.Popen')
+def test_run_cmd_failed_log_failure(mock_popen, mock_log, log_failure):
+    _mock_popen_process(mock_popen, 1, stderr='manifest unknown\n')
+
+    with pytest.raises(IIBError, match='An unexpected error occurred'):
+        utils.run_cmd(['skopeo', 'inspect'], log_failure=log_failure)
 
+    assert mock_log.error.called is log_failure
 
-@mock.patch('iib.workers.tasks.utils.subprocess.run')
-def test_run_cmd_failed_opm(mock_sub_run):
-    mock_rv = mock.Mock()
-    mock_rv.returncode = 1
-    mock_rv.stderr = textwrap.dedent(
+
+@mock.patch('iib.workers.tasks.utils.log')
+@mock.patch('iib.workers.tasks.utils.subprocess.Popen')
+def test_run_cmd_failed_long_stderr(mock_popen, mock_log):
+    stderr = ''.join(f'line {i}\n' for i in range(1000))
+    _mock_popen_process(mock_popen, 1, stderr=stderr)
+
+    with pytest.raises(IIBError, match='An unexpected error occurred'):
+        utils.run_cmd(['echo', 'hello'])
+
+    # Every line is logged as it's read, but only the last lines are kept for the error
+    mock_log.debug.assert_any_call('%s: %s', 'echo', 'line 0')
+    mock_log.debug.assert_any_call('%s: %s', 'echo', 'line 999')
+    mock_log.error.assert_called_once_with(
+        'The command "%s" failed with: %s',
+        'echo hello',
+        '\n'.join(f'line {i}' for i in range(800, 1000)),
+    )
+
+
+@mock.patch('iib.workers.tasks.utils.subprocess.Popen')
+def test_run_cmd_failed_opm(mock_popen):
+    stderr = textwrap.dedent(
         '''
         time="2020-05-12T15:42:19Z" level=info msg="loading bundle file" dir=bundle_tmp775962984/manifests file=serverstatusrequest.crd.yaml load=bundle
         time="2020-05-12T15:42:19Z" level=info msg="loading bundle file" dir=bundle_tmp775962984/manifests file=volumesnapshotlocation.crd.yaml load=bundle
@@ -269,7 +327,7 @@ def test_run_cmd_failed_opm(mock_sub_run):
           -t, --tag string              custom tag for container image being built
         '''  # noqa: E501
     )
-    mock_sub_run.return_value = mock_rv
+    _mock_popen_process(mock_popen, 1, stderr=stderr)
 
     expected_exc = (
         'Failed to add the bundles to the index image: error loading bundle from image: Error '
@@ -282,7 +340,7 @@ def test_run_cmd_failed_opm(mock_sub_run):
             exc_msg='Failed to add the bundles to the index image',
         )
 
-    mock_sub_run.assert_called_once()
+    mock_popen.assert_called_once()
 
 
 @mock.patch('iib.workers.tasks.utils.run_cmd')
@@ -300,7 +358,9 @@ def test_skopeo_inspect(mock_run_cmd):
 def test_podman_pull(mock_run_cmd):
     image = 'some-image:latest'
     utils.podman_pull(image)
-    mock_run_cmd.assert_called_once_with(['podman', 'pull', image], exc_msg=mock.ANY)
+    mock_run_cmd.assert_called_once_with(
+        ['podman', 'pull', image], exc_msg=mock.ANY, capture_stdout=False
+    )
 
 
 def test_request_logger(tmpdir):
@@ -419,6 +479,10 @@ def test_get_resolved_image(mock_si, pull_spec, expected):
     ).strip('\n')
     rv = utils.get_resolved_image(pull_spec)
     assert rv == expected
+    if '@sha256:' in pull_spec:
+        mock_si.assert_not_called()
+    else:
+        mock_si.assert_called_once()
 
 
 @mock.patch('iib.workers.tasks.utils.skopeo_inspect')
@@ -532,6 +596,21 @@ def test_get_resolved_bundles_success(mock_si, mock_gri, skopeo_inspect_rv, expe
     assert response == expected_response
 
 
+@mock.patch('iib.workers.tasks.utils.get_resolved_image')
+@mock.patch('iib.workers.tasks.utils.skopeo_inspect')
+def test_get_resolved_bundles_multiple(mock_si, mock_gri):
+    mock_si.return_value = {
+        'mediaType': 'application/vnd.docker.distribution.manifest.v2+json',
+        'schemaVersion': 2,
+    }
+    mock_gri.side_effect = lambda pull_spec: pull_spec.replace(':', '@sha256:')
+
+    response = utils.get_resolved_bundles(['bundle-b:1', 'bundle-a:1', 'bundle-b:1'])
+
+    assert response == ['bundle-a@sha256:1', 'bundle-b@sha256:1']
+    assert mock_si.call_count == 3
+
+
 @mock.patch('iib.workers.tasks.utils.skopeo_inspect')
 def test_get_resolved_bundles_failure(mock_si):
     skopeo_inspect_rv = {
@@ -604,7 +683,7 @@ def testdeprecate_bundles(mock_srt, mock_run_cmd):
     ]
     utils.deprecate_bundles(bundles, 'some_dir', binary_image, from_index, '4.6')
     mock_run_cmd.assert_called_once_with(
-        cmd, {'cwd': 'some_dir'}, exc_msg='Failed to deprecate the bundles'
+        cmd, {'cwd': 'some_dir'}, exc_msg='Failed to deprecate the bundles', capture_stdout=False
     )
 
 
@@ -650,34 +729,73 @@ def test_chmod_recursiverly(tmpdir):
     assert_mode(bacon_dir, expected_dir_mode)
 
 
-@mock.patch('iib.workers.tasks.utils.skopeo_inspect')
-def test_get_image_arches(mock_si):
-    mock_si.return_value = {
+def test_get_image_arches_from_manifest():
+    manifest = {
         'mediaType': 'application/vnd.docker.distribution.manifest.list.v2+json',
         'manifests': [
             {'platform': {'architecture': 'amd64'}},
             {'platform': {'architecture': 's390x'}},
         ],
     }
-    rv = utils.get_image_arches('image:latest')
+    rv = utils._get_image_arches_from_manifest('image:latest', manifest)
     assert rv == {'amd64', 's390x'}
 
 
 @mock.patch('iib.workers.tasks.utils.skopeo_inspect')
-def test_get_image_arches_manifest(mock_si):
+def test_get_image_arches_from_manifest_v2_manifest(mock_si):
+    mock_si.return_value = {'architecture': 'amd64'}
+    manifest = {'mediaType': 'application/vnd.docker.distribution.manifest.v2+json'}
+    rv = utils._get_image_arches_from_manifest('image:latest', manifest)
+    assert rv == {'amd64'}
+    mock_si.assert_called_once_with('docker://image:latest', '--config')
+
+
+@mock.patch('iib.workers.tasks.utils.skopeo_inspect')
+def test_get_resolved_image_and_arches(mock_si):
+    pull_spec = 'quay.io/ns/image:latest'
+    mock_si.return_value = (
+        '{"schemaVersion":2,'
+        '"mediaType":"application/vnd.docker.distribution.manifest.list.v2+json",'
+        '"manifests":[{"platform":{"architecture":"amd64"}},{"platform":{"architecture":"s390x"}}]}'
+    )
+
+    rv = utils.get_resolved_image_and_arches(pull_spec)
+
+    assert rv == (
+        'quay.io/ns/image@sha256:f0c722ff489e672b328e1efb5e445b89dfc2955c7ea980940925927a0a8b030e',
+        {'amd64', 's390x'},
+    )
+    mock_si.assert_called_once_with(f'docker://{pull_spec}', '--raw', return_json=False)
+
+
+@mock.patch('iib.workers.tasks.utils.skopeo_inspect')
+def test_get_resolved_image_and_arches_manifest(mock_si):
     mock_si.side_effect = [
-        {'mediaType': 'application/vnd.docker.distribution.manifest.v2+json'},
+        (
+            '{"schemaVersion":2,'
+            '"mediaType":"application/vnd.docker.distribution.manifest.v2+json"}'
+        ),
         {'architecture': 'amd64'},
     ]
-    rv = utils.get_image_arches('image:latest')
-    assert rv == {'amd64'}
 
+    rv = utils.get_resolved_image_and_arches('quay.io/ns/image:latest')
 
-@mock.patch('iib.workers.tasks.utils.skopeo_inspect')
-def test_get_image_arches_not_manifest_list(mock_si):
-    mock_si.return_value = {'mediaType': 'application/vnd.docker.distribution.notmanifest.v2+json'}
+    assert rv == (
+        'quay.io/ns/image@sha256:74650f9ea72d624d418435f57b997feec86725c0dccb55d3c9e96d6b8d0669b0',
+        {'amd64'},
+    )
+    assert mock_si.call_count == 2
+    mock_si.assert_called_with(
+        'docker://quay.io/ns/image@sha256:'
+        '74650f9ea72d624d418435f57b997feec86725c0dccb55d3c9e96d6b8d0669b0',
+        '--config',
+    )
+
+
+def test_get_image_arches_from_manifest_not_manifest_list():
+    manifest = {'mediaType': 'application/vnd.docker.distribution.notmanifest.v2+json'}
     with pytest.raises(IIBError, match='.+is neither a v2 manifest list nor a v2 manifest'):
-        utils.get_image_arches('image:latest')
+        utils._get_image_arches_from_manifest('image:latest', manifest)
 
 
 @pytest.mark.parametrize('label, expected', (('some_label', 'value'), ('not_there', None)))
@@ -693,7 +811,10 @@ def test_get_image_label(mock_si, label, expected):
 @mock.patch('iib.workers.tasks.utils.get_worker_config')
 @mock.patch('iib.workers.tasks.utils.get_image_labels')
 def test_verify_labels(mock_gil, mock_gwc, iib_required_labels):
-    mock_gwc.return_value = {'iib_required_labels': iib_required_labels}
+    mock_gwc.return_value = {
+        'iib_image_inspection_threads': 5,
+        'iib_required_labels': iib_required_labels,
+    }
     mock_gil.return_value = {'com.redhat.delivery.operator.bundle': 'true'}
     utils.verify_labels(['some-bundle:v1.0'])
 
@@ -706,7 +827,10 @@ def test_verify_labels(mock_gil, mock_gwc, iib_required_labels):
 @mock.patch('iib.workers.tasks.utils.get_worker_config')
 @mock.patch('iib.workers.tasks.utils.get_image_labels')
 def test_verify_labels_fails(mock_gil, mock_gwc):
-    mock_gwc.return_value = {'iib_required_labels': {'com.redhat.delivery.operator.bundle': 'true'}}
+    mock_gwc.return_value = {
+        'iib_image_inspection_threads': 5,
+        'iib_required_labels': {'com.redhat.delivery.operator.bundle': 'true'},
+    }
     mock_gil.return_value = {'lunch': 'pizza'}
     with pytest.raises(IIBError, match='som'):
         utils.verify_labels(['some-bundle:v1.0'])
@@ -775,15 +899,15 @@ def test_verify_labels_fails(mock_gil, mock_gwc):
 )
 @mock.patch('iib.workers.tasks.build.set_request_state')
 @mock.patch('iib.workers.tasks.utils.set_request_state')
-@mock.patch('iib.workers.tasks.utils.get_resolved_image')
-@mock.patch('iib.workers.tasks.utils.get_image_arches')
+@mock.patch('iib.workers.tasks.utils.get_resolved_image_and_arches')
+@mock.patch('iib.workers.tasks.utils.get_image_labels')
 @mock.patch('iib.workers.tasks.utils.get_image_label')
 @mock.patch('iib.workers.tasks.build.update_request')
 def test_prepare_request_for_build(
     mock_ur,
     mock_gil,
-    mock_gia,
-    mock_gri,
+    mock_gils,
+    mock_griaa,
     mock_srs,
     mock_srs2,
     add_arches,
@@ -807,17 +931,18 @@ def test_prepare_request_for_build(
     if from_index:
         from_index_name = from_index.split(':', 1)[0]
         from_index_resolved = f'{from_index_name}@sha256:bcdefg'
-        index_resolved = f'{from_index_name}@sha256:abcdef1234'
-        mock_gri.side_effect = [from_index_resolved, binary_image_resolved, index_resolved]
-        mock_gia.side_effect = [from_index_arches, expected_arches]
+        mock_griaa.side_effect = [
+            (from_index_resolved, from_index_arches),
+            (binary_image_resolved, expected_arches),
+        ]
         expected_payload_keys.add('from_index_resolved')
-        gil_side_effect = ['v4.6', resolved_distribution_scope]
+        mock_gils.return_value = {
+            'com.redhat.index.delivery.version': 'v4.6',
+            'com.redhat.index.delivery.distribution_scope': resolved_distribution_scope,
+        }
         ocp_version = 'v4.6'
     else:
-        index_resolved = f'index-image@sha256:abcdef1234'
-        mock_gri.side_effect = [binary_image_resolved, index_resolved]
-        mock_gia.side_effect = [expected_arches]
-        gil_side_effect = []
+        mock_griaa.side_effect = [(binary_image_resolved, expected_arches)]
 
     if bundles:
         bundle_side_effects = [bundle.rsplit('/', 1)[1].split(':', 1)[0] for bundle in bundles]
@@ -855,13 +980,18 @@ def test_prepare_request_for_build(
         'target_index_resolved': None,
         'target_ocp_version': 'v4.6',
     }
+    if from_index:
+        mock_griaa.assert_has_calls([mock.call(from_index), mock.call(binary_image)])
+        mock_gils.assert_called_once_with(from_index_resolved)
+    else:
+        mock_griaa.assert_called_once_with(binary_image)
+        mock_gils.assert_not_called()
 
 
 @mock.patch('iib.workers.tasks.utils.set_request_state')
 @mock.patch('iib.workers.tasks.utils.get_index_image_info')
-@mock.patch('iib.workers.tasks.utils.get_resolved_image')
-@mock.patch('iib.workers.tasks.utils.get_image_arches')
-def test_prepare_request_for_build_merge_index_img(mock_gia, mock_gri, mock_giii, mock_srs):
+@mock.patch('iib.workers.tasks.utils.get_resolved_image_and_arches')
+def test_prepare_request_for_build_merge_index_img(mock_griaa, mock_giii, mock_srs):
     from_index_image_info = {
         'resolved_from_index': None,
         'ocp_version': 'v4.5',
@@ -882,8 +1012,7 @@ def test_prepare_request_for_build_merge_index_img(mock_gia, mock_gri, mock_giii
         'resolved_distribution_scope': 'stage',
     }
     mock_giii.side_effect = [from_index_image_info, source_index_image_info, target_index_info]
-    mock_gri.return_value = 'binary-image@sha256:12345'
-    mock_gia.return_value = {'amd64'}
+    mock_griaa.return_value = ('binary-image@sha256:12345', {'amd64'})
     rv = utils.prepare_request_for_build(
         1,
         utils.RequestConfigMerge(
@@ -910,10 +1039,9 @@ def test_prepare_request_for_build_merge_index_img(mock_gia, mock_gri, mock_giii
 
 
 @mock.patch('iib.workers.tasks.utils.set_request_state')
-@mock.patch('iib.workers.tasks.utils.get_resolved_image')
-@mock.patch('iib.workers.tasks.utils.get_image_arches')
-def test_prepare_request_for_build_no_arches(mock_gia, mock_gri, mock_srs):
-    mock_gia.side_effect = [{'amd64'}]
+@mock.patch('iib.workers.tasks.utils.get_resolved_image_and_arches')
+def test_prepare_request_for_build_no_arches(mock_griaa, mock_srs):
+    mock_griaa.side_effect = [('binary-image@sha256:12345', {'amd64'})]
 
     with pytest.raises(IIBError, match='No arches.+'):
         utils.prepare_request_for_build(
@@ -922,10 +1050,9 @@ def test_prepare_request_for_build_no_arches(mock_gia, mock_gri, mock_srs):
 
 
 @mock.patch('iib.workers.tasks.utils.set_request_state')
-@mock.patch('iib.workers.tasks.utils.get_resolved_image')
-@mock.patch('iib.workers.tasks.utils.get_image_arches')
-def test_prepare_request_for_build_binary_image_no_arch(mock_gia, mock_gri, mock_srs):
-    mock_gia.side_effect = [{'amd64'}]
+@mock.patch('iib.workers.tasks.utils.get_resolved_image_and_arches')
+def test_prepare_request_for_build_binary_image_no_arch(mock_griaa, mock_srs):
+    mock_griaa.side_effect = [('binary-image@sha256:12345', {'amd64'})]
 
     expected = 'The binary image is not available for the following arches.+'
     with pytest.raises(IIBError, match=expected):